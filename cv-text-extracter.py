@@ -1,7 +1,14 @@
 import os
+from run_profiler import start_profiling_if_requested, stage, strip_profile_flag
+
+# Start profiling before importing PyMuPDF; reports go next to the extracted text
+start_profiling_if_requested(
+    "cv-text-extracter",
+    output_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "cv-texts"),
+)
+
 # from PyPDF2 import PdfReader # Removed PyPDF2
 import fitz  # PyMuPDF # Added PyMuPDF
-import sys
 
 def extract_text_from_pdf(pdf_path):
     """
@@ -61,6 +68,25 @@ def save_text_to_file(text, output_path):
     except Exception as e:
         print(f"Error saving text to file '{output_path}': {e}")
 
+def run_extraction(input_pdf_path, output_txt_path):
+    """
+    Extracts text from the input PDF and saves it to the output path.
+
+    Args:
+        input_pdf_path (str): The full path to the input PDF file.
+        output_txt_path (str): The full path for the output text file.
+    """
+    # Extract text from the PDF
+    with stage("pdf_extract"):
+        extracted_content = extract_text_from_pdf(input_pdf_path)
+
+    # Save the extracted text if extraction was successful
+    if extracted_content is not None:
+        with stage("save_text"):
+            save_text_to_file(extracted_content, output_txt_path)
+    else:
+        print("Text extraction failed. No text file created.")
+
 if __name__ == "__main__":
     # --- Configuration ---
     # Get the absolute path of the directory where the script is located
@@ -71,8 +97,9 @@ if __name__ == "__main__":
     output_text_directory = os.path.join(script_dir, "cv-texts")
 
     # You can specify the PDF filename directly or get it from arguments
-    if len(sys.argv) > 1:
-        pdf_filename = sys.argv[1]
+    args = strip_profile_flag()
+    if args:
+        pdf_filename = args[0]
         print(f"Using PDF filename from command line argument: {pdf_filename}")
     else:
         # Default PDF filename if no argument is provided
@@ -89,11 +116,4 @@ if __name__ == "__main__":
     output_txt_path = os.path.join(output_text_directory, output_txt_filename)
     # --- End Configuration ---
 
-    # Extract text from the PDF
-    extracted_content = extract_text_from_pdf(input_pdf_path)
-
-    # Save the extracted text if extraction was successful
-    if extracted_content is not None:
-        save_text_to_file(extracted_content, output_txt_path)
-    else:
-        print("Text extraction failed. No text file created.")
\ No newline at end of file
+    run_extraction(input_pdf_path, output_txt_path)
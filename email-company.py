@@ -1,3 +1,8 @@
+from run_profiler import start_profiling_if_requested, stage
+
+# Start profiling before the imports below so their cost is included
+start_profiling_if_requested("email-company")
+
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -118,17 +123,19 @@ class CompanyEmailGenerator:
                 subject = f"Interest in {self.company_name} - {SENDER_NAME}"
                 body = message_content
             
-            msg = MIMEMultipart()
-            msg['From'] = f"{SENDER_NAME} <{EMAIL}>"
-            msg['To'] = self.recipient_email
-            msg['Subject'] = subject
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            if self.attachment_path and os.path.exists(self.attachment_path):
-                self.attach_file(msg, self.attachment_path)
+            with stage("mime_build"):
+                msg = MIMEMultipart()
+                msg['From'] = f"{SENDER_NAME} <{EMAIL}>"
+                msg['To'] = self.recipient_email
+                msg['Subject'] = subject
+                
+                msg.attach(MIMEText(body, 'plain'))
+                
+                if self.attachment_path and os.path.exists(self.attachment_path):
+                    self.attach_file(msg, self.attachment_path)
             
-            self.email_message = msg.as_string()
+            with stage("as_string"):
+                self.email_message = msg.as_string()
             
         except Exception as e:
             print(f"Error creating email message for {self.company_name}: {e}")
@@ -174,7 +181,8 @@ def main():
             raise SystemExit("Cannot proceed without CV text and email prompt template files.")
         
         # Load company list
-        df = pd.read_csv(COMPANY_LIST_PATH)
+        with stage("csv_load"):
+            df = pd.read_csv(COMPANY_LIST_PATH)
         print(f"Successfully loaded {len(df)} companies from CSV")
         
         # Connect to SMTP server
@@ -184,7 +192,8 @@ def main():
         print("Successfully connected to email server!")
         
         # Process each company
-        company_list = df.to_dict('records')
+        with stage("to_dict"):
+            company_list = df.to_dict('records')
         
         for company in tqdm(company_list, desc="Processing companies", unit="email"):
             if pd.isna(company.get('email')) or pd.isna(company.get('company_name')):
@@ -1,3 +1,8 @@
+from run_profiler import start_profiling_if_requested, stage
+
+# Start profiling before the imports below so their cost is included
+start_profiling_if_requested("email-research")
+
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -165,21 +170,23 @@ class ResearchPositionEmailGenerator:
     def create_email_message(self, message_body):
         """Create the complete email message with proper formatting and attachments."""
         try:
-            msg = MIMEMultipart()
-            msg['From'] = f"{SENDER_NAME} <{EMAIL}>"
-            msg['To'] = self.recipient_email
-            msg['Subject'] = self.subject
-            
-            # Attach message body
-            msg.attach(MIMEText(message_body, 'plain'))
-            
-            # Attach CV if path provided and file exists
-            if self.attachment_path and os.path.exists(self.attachment_path):
-                self.attach_file(msg, self.attachment_path)
-            elif self.attachment_path:
-                print(f"Warning: Attachment file not found at {self.attachment_path}")
+            with stage("mime_build"):
+                msg = MIMEMultipart()
+                msg['From'] = f"{SENDER_NAME} <{EMAIL}>"
+                msg['To'] = self.recipient_email
+                msg['Subject'] = self.subject
+                
+                # Attach message body
+                msg.attach(MIMEText(message_body, 'plain'))
+                
+                # Attach CV if path provided and file exists
+                if self.attachment_path and os.path.exists(self.attachment_path):
+                    self.attach_file(msg, self.attachment_path)
+                elif self.attachment_path:
+                    print(f"Warning: Attachment file not found at {self.attachment_path}")
             
-            self.email_message = msg.as_string()
+            with stage("as_string"):
+                self.email_message = msg.as_string()
             
         except Exception as e:
             print(f"Error creating email message for {self.professor_name}: {e}")
@@ -264,7 +271,8 @@ def main():
     
     try:
         # Load contact list
-        df = load_contact_list(CONTACT_LIST_PATH)
+        with stage("csv_load"):
+            df = load_contact_list(CONTACT_LIST_PATH)
         if df is None:
             return
         
@@ -287,7 +295,8 @@ def main():
         print("Successfully connected to email server!")
         
         # Process each contact
-        contact_list = df.to_dict('records')
+        with stage("to_dict"):
+            contact_list = df.to_dict('records')
         
         for contact in tqdm(contact_list, desc="Processing contacts", unit="email"):
             # Validate required data
@@ -0,0 +1,345 @@
+import atexit
+import cProfile
+import contextlib
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_FLAG = "--profile"
+DEFAULT_PROFILE_OUTPUT_DIR = "profiles"
+DEFAULT_PROFILE_TOP_N = 25
+
+# Keep the profiler's own bookkeeping out of the allocation reports
+EXCLUDED_FILENAMES = {
+    __file__,
+    tracemalloc.__file__,
+    contextlib.__file__,
+}
+
+# Active profiler for the current run, or None when profiling is disabled
+_active_profiler = None
+
+def profiling_requested(argv=None):
+    """Return True if the --profile flag was passed on the command line."""
+    argv = sys.argv[1:] if argv is None else argv
+    return PROFILE_FLAG in argv
+
+def strip_profile_flag(argv=None):
+    """Return the command line arguments with the --profile flag removed."""
+    argv = sys.argv[1:] if argv is None else argv
+    return [arg for arg in argv if arg != PROFILE_FLAG]
+
+@contextmanager
+def stage(name):
+    """Record time and peak memory for a named stage of the run.
+
+    Does nothing unless a profiled run is in progress, so it is safe to leave
+    in place around the normal code paths.
+    """
+    if _active_profiler is None:
+        yield
+        return
+    with _active_profiler.stage(name):
+        yield
+
+class RunProfiler:
+    """Wraps a run with cProfile and tracemalloc and writes the reports.
+
+    Settings left as None are read from PROFILE_OUTPUT_DIR and PROFILE_TOP_N
+    the first time they are needed, so values loaded from .env after the
+    profiler has started are still picked up.
+    """
+
+    def __init__(self, run_name, output_dir=None, top_n=None):
+        self.run_name = run_name
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.stages = {}
+        self.profile = cProfile.Profile()
+        self.started_at = None
+        self.elapsed = 0.0
+        # Peak traced memory per open stage; the first entry covers the whole run
+        self._peak_stack = [0]
+        # Memory held by baseline snapshots of open stages, excluded from peaks
+        self._snapshot_overhead = 0
+        # Time spent on the profiler's own bookkeeping, excluded from stage timings
+        self._overhead_seconds = 0.0
+        # Stages whose first call has already been snapshotted
+        self._snapshotted_stages = set()
+
+    @property
+    def run_peak(self):
+        return self._peak_stack[0]
+
+    def get_top_n(self):
+        """Return the number of report entries, reading PROFILE_TOP_N once.
+
+        Invalid values fall back to the default rather than raising, since
+        this runs in the middle of the profiled program.
+        """
+        if self.top_n is None:
+            value = os.getenv("PROFILE_TOP_N", str(DEFAULT_PROFILE_TOP_N))
+            try:
+                self.top_n = int(value)
+            except ValueError:
+                self.top_n = 0
+            if self.top_n <= 0:
+                print(f"Warning: invalid PROFILE_TOP_N '{value}', using {DEFAULT_PROFILE_TOP_N}")
+                self.top_n = DEFAULT_PROFILE_TOP_N
+        return self.top_n
+
+    def get_output_dir(self):
+        """Return the report directory, reading PROFILE_OUTPUT_DIR once."""
+        if self.output_dir is None:
+            self.output_dir = os.getenv("PROFILE_OUTPUT_DIR", DEFAULT_PROFILE_OUTPUT_DIR)
+        return self.output_dir
+
+    def start(self):
+        """Start CPU profiling and allocation tracing."""
+        tracemalloc.start()
+        self.started_at = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        """Stop profiling and fold the final tracemalloc peak into the run peak."""
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self.started_at
+        self._fold_peak()
+        tracemalloc.stop()
+
+    def _fold_peak(self):
+        """Fold the current tracemalloc peak into the innermost open stage."""
+        peak = tracemalloc.get_traced_memory()[1] - self._snapshot_overhead
+        self._peak_stack[-1] = max(self._peak_stack[-1], peak)
+
+    @contextmanager
+    def _overhead(self):
+        """Time the profiler's own work so it can be excluded from stage timings.
+
+        cProfile keeps running throughout; disabling it mid-run would close the
+        enclosing frames and lose their cumulative time.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._overhead_seconds += time.perf_counter() - start_time
+
+    def _take_snapshot(self):
+        """Take an unfiltered snapshot, returning it with the memory it holds.
+
+        The transient spike from building the snapshot is discarded by
+        resetting the peak once it has been folded into the open stages.
+        """
+        self._fold_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot()
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.reset_peak()
+        return snapshot, size
+
+    def _diff_snapshots(self, snapshot, baseline):
+        """Return the top allocation sites added between two snapshots.
+
+        The comparison walks every trace in Python, so it runs in a worker
+        thread where cProfile's hooks are not installed. Results are grouped
+        by line, so dropping the profiler's own files afterwards is equivalent
+        to filtering the traces first and much cheaper.
+        """
+        result = []
+        worker = threading.Thread(
+            target=lambda: result.extend(snapshot.compare_to(baseline, 'lineno'))
+        )
+        worker.start()
+        worker.join()
+        top_n = self.get_top_n()
+        allocations = []
+        for stat in result:
+            if stat.traceback[0].filename in EXCLUDED_FILENAMES:
+                continue
+            allocations.append(stat)
+            if len(allocations) == top_n:
+                break
+        return allocations
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a stage, keeping per-call maxima across its calls.
+
+        Stages may nest: the inner stage's peak is folded back into the outer
+        one on exit. Every call is measured with tracemalloc's counters; only
+        the first call of each stage takes snapshots for the allocation report.
+        Profiler errors are reported and never propagate into the stage body.
+        """
+        try:
+            measurement = self._enter_stage(name)
+        except Exception as e:
+            print(f"Profiler error entering stage {name}: {e}")
+            measurement = None
+        try:
+            yield
+        finally:
+            if measurement is not None:
+                try:
+                    self._exit_stage(name, measurement)
+                except Exception as e:
+                    print(f"Profiler error leaving stage {name}: {e}")
+
+    def _enter_stage(self, name):
+        """Start measuring a stage and return the state needed to finish it."""
+        with self._overhead():
+            baseline, baseline_size = None, 0
+            if name in self._snapshotted_stages:
+                self._fold_peak()
+                tracemalloc.reset_peak()
+            else:
+                self._snapshotted_stages.add(name)
+                baseline, baseline_size = self._take_snapshot()
+                self._snapshot_overhead += baseline_size
+            start_current = tracemalloc.get_traced_memory()[0] - self._snapshot_overhead
+            self._peak_stack.append(start_current)
+        return {
+            'baseline': baseline,
+            'baseline_size': baseline_size,
+            'start_current': start_current,
+            'start_overhead': self._overhead_seconds,
+            'start_time': time.perf_counter(),
+        }
+
+    def _exit_stage(self, name, measurement):
+        """Finish measuring a stage and fold its results into the stage totals."""
+        elapsed = (time.perf_counter() - measurement['start_time']
+                   - (self._overhead_seconds - measurement['start_overhead']))
+        with self._overhead():
+            self._fold_peak()
+            current = tracemalloc.get_traced_memory()[0] - self._snapshot_overhead
+            peak = self._peak_stack.pop()
+            self._peak_stack[-1] = max(self._peak_stack[-1], peak)
+
+            stats = self.stages.setdefault(name, {
+                'calls': 0,
+                'seconds': 0.0,
+                'peak_bytes': 0,
+                'retained_bytes': None,
+                'top_allocations': [],
+            })
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            stats['peak_bytes'] = max(stats['peak_bytes'], peak - measurement['start_current'])
+            retained = current - measurement['start_current']
+            if stats['retained_bytes'] is None or retained > stats['retained_bytes']:
+                stats['retained_bytes'] = retained
+
+            baseline = measurement.pop('baseline')
+            if baseline is not None:
+                try:
+                    snapshot, _ = self._take_snapshot()
+                    stats['top_allocations'] = self._diff_snapshots(snapshot, baseline)
+                    del snapshot
+                finally:
+                    del baseline
+                    self._snapshot_overhead -= measurement['baseline_size']
+            tracemalloc.reset_peak()
+
+    def write_reports(self):
+        """Write the pstats file and allocation report, returning their paths."""
+        output_dir = self.get_output_dir()
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        base_path = os.path.join(output_dir, f"{self.run_name}_{timestamp}")
+
+        pstats_path = f"{base_path}.pstats"
+        self.profile.dump_stats(pstats_path)
+
+        report_path = f"{base_path}_allocations.txt"
+        with open(report_path, 'w', encoding='utf-8') as file:
+            file.write(self.format_report())
+
+        return pstats_path, report_path
+
+    def format_report(self):
+        """Format stage peaks, top allocations and top CPU functions as text."""
+        top_n = self.get_top_n()
+        lines = [
+            f"Profile report for {self.run_name}",
+            f"Wall time: {self.elapsed:.3f}s "
+            f"(including {self._overhead_seconds:.3f}s of profiler overhead)",
+            f"Peak traced memory: {_format_size(self.run_peak)}",
+            "",
+            "--- Stage summary (peak and retained are the largest single call) ---",
+            f"{'stage':<20} {'calls':>7} {'seconds':>10} {'max peak':>12} {'max retained':>14}",
+        ]
+        for name, stats in self.stages.items():
+            lines.append(
+                f"{name:<20} {stats['calls']:>7} {stats['seconds']:>10.3f} "
+                f"{_format_size(stats['peak_bytes']):>12} {_format_size(stats['retained_bytes']):>14}"
+            )
+        if not self.stages:
+            lines.append("(no stages recorded)")
+
+        for name, stats in self.stages.items():
+            lines.extend([
+                "",
+                f"--- Top {top_n} allocation sites in {name} "
+                f"(first call of {stats['calls']}) ---",
+            ])
+            for stat in stats['top_allocations']:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{_format_size(stat.size_diff):>12} {stat.count_diff:>+8} blocks  "
+                    f"{frame.filename}:{frame.lineno}"
+                )
+
+        lines.extend(["", f"--- Top {top_n} functions by cumulative time ---"])
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(top_n)
+        lines.append(stream.getvalue().strip())
+
+        return '\n'.join(lines) + '\n'
+
+def _format_size(num_bytes):
+    """Format a byte count as KiB or MiB."""
+    if abs(num_bytes) >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.2f} MiB"
+    return f"{num_bytes / 1024:.1f} KiB"
+
+def start_profiling(run_name, output_dir=None, top_n=None):
+    """Start profiling the rest of the process and write reports at exit."""
+    global _active_profiler
+    if _active_profiler is not None:
+        return _active_profiler
+    _active_profiler = RunProfiler(run_name, output_dir=output_dir, top_n=top_n)
+    _active_profiler.start()
+    atexit.register(finish_profiling)
+    return _active_profiler
+
+def start_profiling_if_requested(run_name, output_dir=None):
+    """Start profiling when --profile was passed; call before heavy imports."""
+    if profiling_requested():
+        return start_profiling(run_name, output_dir=output_dir)
+    return None
+
+def finish_profiling():
+    """Stop the active profiler, write its reports and print a summary."""
+    global _active_profiler
+    profiler = _active_profiler
+    if profiler is None:
+        return
+    _active_profiler = None
+    profiler.stop()
+    try:
+        pstats_path, report_path = profiler.write_reports()
+        print(f"\n--- Profile Summary ---")
+        print(f"Peak traced memory: {_format_size(profiler.run_peak)}")
+        for name, stats in profiler.stages.items():
+            print(f"{name}: {stats['calls']} call(s), max peak {_format_size(stats['peak_bytes'])}")
+        print(f"CPU profile written to: {pstats_path}")
+        print(f"Allocation report written to: {report_path}")
+    except Exception as e:
+        print(f"Error writing profile reports to {profiler.get_output_dir()}: {e}")